@@ -0,0 +1,24 @@
+import os
+import datetime
+from dateutil.relativedelta import relativedelta
+from dotenv import load_dotenv
+
+# Scripts import this before gitlab_client, so read .env here too
+load_dotenv()
+
+# Length of the reporting window shared by the user activity scripts
+MONTHS_TO_GO_BACK = 6
+# Users printed in the console summaries, busiest first; 0 prints everyone
+TOP_K = int(os.getenv("TOP_K", "0") or 0)
+
+def compute_window(months):
+    """
+    Returns the (after, before) dates of a window reaching back `months` calendar months,
+    as the YYYY-MM-DD strings the API expects. 'before' is tomorrow, so today's events are included.
+    """
+    end = datetime.date.today() + datetime.timedelta(days=1)
+    # relativedelta subtracts calendar months instead of approximating them as 30 days
+    start = end - relativedelta(months=months)
+    return start.isoformat(), end.isoformat()
+
+AFTER_DATE, BEFORE_DATE = compute_window(MONTHS_TO_GO_BACK)
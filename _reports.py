@@ -0,0 +1,60 @@
+import datetime
+import xlsxwriter
+from _dates import AFTER_DATE, BEFORE_DATE
+from gitlab_client import API_ERRORS
+
+# Placeholder for a missing date or commit SHA, shared by every row that needs one
+NA = "N/A"
+
+def format_push_date(last_push_iso):
+    """Formats a push timestamp from the API for output, or returns NA if there was no push."""
+    if not last_push_iso:
+        return NA
+    last_push_datetime = datetime.datetime.fromisoformat(last_push_iso.replace('Z', '+00:00'))
+    return last_push_datetime.strftime('%Y-%m-%d %H:%M:%S')
+
+def get_user_push_count(client, user_id, username):
+    """
+    Counts 'pushed to' events for a single user within the time window and records
+    the details of the most recent push.
+
+    Returns: (push_count, last_push_date, last_push_commit_sha)
+    """
+    push_count = 0
+
+    # GitLab returns fixed-width UTC timestamps (YYYY-MM-DDTHH:MM:SS.sssZ), which
+    # sort lexicographically, so the raw strings are compared instead of parsed.
+    last_push_iso = ''
+    last_push_commit_sha = NA
+
+    try:
+        for event in client.push_events(user_id, AFTER_DATE, BEFORE_DATE):
+            push_count += 1
+
+            created_at = event['created_at']
+            if created_at > last_push_iso:
+                last_push_iso = created_at
+                push_data = event.get('push_data') or {} # null for some events
+                last_push_commit_sha = push_data.get('commit_to') or NA
+
+    except API_ERRORS as e:
+        print(f"Error fetching events for user {username} (ID: {user_id}): {e}")
+
+    # Only the latest timestamp is parsed, for output
+    return (push_count, format_push_date(last_push_iso), last_push_commit_sha)
+
+def streaming_workbook(filename):
+    """
+    Opens an XLSX workbook that streams each row to disk as soon as it is written.
+
+    In constant_memory mode rows have to be written top to bottom (which rules out
+    pandas' to_excel), so fill each sheet with `write_sheet`.
+    """
+    return xlsxwriter.Workbook(filename, {'constant_memory': True})
+
+def write_sheet(workbook, sheet_name, header, rows):
+    """Writes a header row followed by `rows` (sequences of cell values) to a new worksheet."""
+    worksheet = workbook.add_worksheet(sheet_name)
+    worksheet.write_row(0, 0, header)
+    for row_num, row in enumerate(rows, start=1):
+        worksheet.write_row(row_num, 0, row)
@@ -0,0 +1,287 @@
+import requests
+import requests_cache
+import orjson
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import os
+import datetime
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# --- Configuration ---
+GITLAB_URL = os.getenv("GITLAB_URL")
+PRIVATE_TOKEN = os.getenv("GITLAB_PRIVATE_TOKEN")
+
+# Note: The API is paginated, so we use per_page=100 (max) to minimize requests
+PER_PAGE = 100
+# Users whose events are fetched concurrently, and the cap on requests in flight at
+# once across all of them; kept low to respect GitLab rate limits
+MAX_WORKERS = int(os.getenv("GITLAB_MAX_WORKERS", "10"))
+# Event pages fetched concurrently per user, once the page count is known.
+# They share the MAX_WORKERS request cap with every other user's pages.
+PAGE_WORKERS = 3
+
+# Lookups of a project that keeps failing (e.g. 5xx) before it is given up on for the run.
+# Each lookup already goes through the adapter's retries.
+PROJECT_LOOKUP_ATTEMPTS = 2
+
+# Cached responses older than this are dropped when a client starts. Event URLs carry
+# the report window's dates, which move every day, so older pages are never asked for again.
+CACHE_RETENTION = datetime.timedelta(days=1)
+
+# Errors raised by a failed request or a page that isn't valid JSON
+API_ERRORS = (requests.exceptions.RequestException, orjson.JSONDecodeError)
+
+
+def has_next_page(response, items):
+    """
+    Tells whether another page follows `response`, whose decoded page is `items`.
+
+    GitLab leaves `X-Next-Page` empty on the last page, even when that page is full.
+    If the header was stripped (e.g. by a proxy), a full page is taken to mean more.
+    """
+    next_page = response.headers.get('X-Next-Page')
+    if next_page is not None:
+        return bool(next_page)
+    return len(items) == PER_PAGE
+
+
+def was_active_after(user, after):
+    """
+    Tells whether `user` may have been active since `after` (YYYY-MM-DD).
+
+    Pushes count as activity, so users whose `last_activity_on` is older can't have
+    pushed since. That field is only returned to admin tokens; without it every user
+    counts as active.
+    """
+    last_activity_on = user.get('last_activity_on')
+    return not (after and last_activity_on and last_activity_on < after)
+
+
+class GitlabClient:
+    """
+    Shared access to the GitLab REST API for the user activity scripts.
+
+    Wraps one pooled session whose responses are kept in gitlab_cache.sqlite and
+    revalidated with ETag/If-None-Match, so pages that haven't changed since the
+    last run come back as body-less 304s. Failed requests raise one of `API_ERRORS`.
+    """
+
+    def __init__(self, gitlab_url=GITLAB_URL, private_token=PRIVATE_TOKEN):
+        self.api_url = f"{gitlab_url}/api/v4"
+
+        self.session = requests_cache.CachedSession(
+            cache_name='gitlab_cache',
+            backend='sqlite',
+            cache_control=True,
+            expire_after=requests_cache.EXPIRE_IMMEDIATELY,
+            ignored_parameters=['Private-Token'] # Keep the token out of the cache file
+        )
+        # Stored responses never expire on their own (they're only revalidated),
+        # so prune the ones no later run will reuse before the file keeps growing
+        self.session.cache.delete(older_than=CACHE_RETENTION)
+        self.session.headers.update({"Private-Token": private_token})
+
+        adapter = HTTPAdapter(
+            pool_connections=32,
+            pool_maxsize=max(32, MAX_WORKERS), # One connection per concurrent request
+            max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 502, 503, 504])
+        )
+        # Self-hosted instances are often served over plain HTTP, so pool both schemes
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        # Every request takes a slot, so at most MAX_WORKERS are in flight however
+        # many user and page threads are running
+        self.request_slots = threading.BoundedSemaphore(MAX_WORKERS)
+
+        # project_id -> path_with_namespace, filled in as projects are looked up.
+        # User threads look projects up concurrently, so each id gets a lock that
+        # makes the first caller fetch it while the others wait for the result.
+        self.project_paths = {}
+        self.project_locks = {}
+        # project_id -> failed lookups so far, for errors other than 403/404
+        self.project_failures = {}
+
+    def get(self, path, params=None):
+        """Requests an API path (e.g. '/users') and raises an HTTPError for 4xx/5xx responses."""
+        return self.get_url(f"{self.api_url}{path}", params)
+
+    def get_url(self, url, params=None):
+        """Requests a full URL within the request cap and raises an HTTPError for 4xx/5xx responses."""
+        with self.request_slots:
+            response = self.session.get(url, params=params)
+        response.raise_for_status()
+        return response
+
+    def iter_pages(self, path, params, keyset=False):
+        """
+        Yields each decoded page of a paginated API path.
+
+        The first page is fetched on its own to read GitLab's `X-Total-Pages` header;
+        the remaining pages are then requested concurrently. Set `keyset` for paths
+        that support keyset pagination, so result sets too large for that header
+        are walked by keyset instead of ever deeper `page=` offsets.
+        """
+        if keyset:
+            # Keyset pages are ordered by id, so offset pages have to match
+            params = {**params, 'order_by': 'id', 'sort': 'asc'}
+
+        def fetch_page(page):
+            # Pages are fetched from several threads, so each one gets its own params
+            return self.get(path, {**params, 'per_page': PER_PAGE, 'page': page})
+
+        response = fetch_page(1)
+        items = orjson.loads(response.content)
+        yield items
+
+        total_pages = int(response.headers.get('X-Total-Pages') or 0)
+        if total_pages:
+            with ThreadPoolExecutor(max_workers=PAGE_WORKERS) as executor:
+                # Only keep a few pages in flight, so a long history doesn't have
+                # every page body held in memory before the caller gets to it
+                in_flight = deque()
+                for page in range(2, total_pages + 1):
+                    in_flight.append(executor.submit(fetch_page, page))
+                    if len(in_flight) >= 2 * PAGE_WORKERS:
+                        yield orjson.loads(in_flight.popleft().result().content)
+                while in_flight:
+                    yield orjson.loads(in_flight.popleft().result().content)
+        elif keyset and has_next_page(response, items):
+            # GitLab omits X-Total-Pages for very large result sets. Its first keyset
+            # page is the page already yielded, so the walk resumes after it.
+            keyset_pages = self.iter_keyset_pages(path, params)
+            next(keyset_pages)
+            yield from keyset_pages
+        else:
+            # GitLab omits X-Total-Pages for very large result sets, so walk the pages instead
+            page = 2
+            while has_next_page(response, items):
+                response = fetch_page(page)
+                items = orjson.loads(response.content)
+                yield items
+                page += 1
+
+    def iter_keyset_pages(self, path, params):
+        """
+        Yields each decoded page of an API path that supports keyset pagination.
+
+        Each page is found by following the previous response's `Link: rel="next"`
+        URL, which spares GitLab the cost of skipping rows for deep `page=` offsets.
+        """
+        response = self.get(path, {
+            **params,
+            'pagination': 'keyset',
+            'order_by': 'id',
+            'sort': 'asc',
+            'per_page': PER_PAGE
+        })
+
+        while True:
+            yield orjson.loads(response.content)
+
+            next_link = response.links.get('next')
+            if not next_link:
+                break
+            response = self.get_url(next_link['url'])
+
+    def project_path(self, project_id):
+        """
+        Returns a project's `path_with_namespace`, remembering the result for the rest of the run.
+
+        Projects that were deleted or aren't visible to the token map to None. Other
+        failures also return None, and the project is looked up again later in the run,
+        up to PROJECT_LOOKUP_ATTEMPTS times in all.
+        """
+        if project_id in self.project_paths:
+            return self.project_paths[project_id]
+
+        # setdefault is atomic, so every thread gets the same lock for an id
+        with self.project_locks.setdefault(project_id, threading.Lock()):
+            if project_id not in self.project_paths:
+                try:
+                    project = orjson.loads(self.get(f"/projects/{project_id}").content)
+                    self.project_paths[project_id] = project.get('path_with_namespace')
+                except API_ERRORS as e:
+                    response = getattr(e, 'response', None)
+                    if response is None or response.status_code not in (403, 404):
+                        failures = self.project_failures.get(project_id, 0) + 1
+                        self.project_failures[project_id] = failures
+                        if failures < PROJECT_LOOKUP_ATTEMPTS:
+                            return None
+                    # Deleted, hidden, or out of attempts: later events skip the request
+                    self.project_paths[project_id] = None
+        return self.project_paths[project_id]
+
+    def users(self, active_after=None):
+        """
+        Yields every active user.
+
+        If `active_after` (YYYY-MM-DD) is given, users whose `last_activity_on` is
+        older are skipped. That field is only returned to admin tokens.
+        """
+        # Pages after the first are fetched concurrently, like event pages
+        for users in self.iter_pages('/users', {'active': True}, keyset=True):
+            for user in users:
+                if was_active_after(user, active_after):
+                    yield user
+
+    def user_list(self, active_after=None):
+        """
+        Returns [{'id', 'username'}] for every active user (see `users()`), or None
+        after printing the error if the users couldn't be fetched.
+        """
+        try:
+            all_users = [
+                {'id': user.get('id'), 'username': user.get('username')}
+                for user in self.users(active_after=active_after)
+            ]
+        except API_ERRORS as e:
+            print(f"Error fetching users: {e}")
+            return None
+
+        print(f"Found {len(all_users)} active users.")
+        return all_users
+
+    def push_events(self, user_id, after, before):
+        """Yields a user's 'pushed to' events between `after` and `before` (YYYY-MM-DD)."""
+        params = {
+            'action': 'pushed', # Filter by pushed events
+            'after': after,
+            'before': before
+        }
+
+        # The events API has no keyset pagination, so large histories stay on page= offsets
+        for events in self.iter_pages(f"/users/{user_id}/events", params):
+            for event in events:
+                # `action=pushed` also matches branch creations ('pushed new') and
+                # deletions ('deleted'), so only 'pushed to' events are kept
+                if event.get('action_name') == 'pushed to':
+                    yield event
+
+    def all_push_events(self, after, before):
+        """
+        Yields every author's 'pushed to' events between `after` and `before` (YYYY-MM-DD)
+        from `/events?scope=all`.
+
+        GitLab limits that endpoint to projects the token's user is a member of, and
+        admin rights don't widen it, so it only covers the whole instance for a token
+        whose user is a member of every project.
+        """
+        params = {
+            'scope': 'all',
+            'action': 'pushed',
+            'after': after,
+            'before': before
+        }
+
+        for events in self.iter_pages('/events', params):
+            for event in events:
+                # Same filter as push_events(): skip 'pushed new' and 'deleted'
+                if event.get('action_name') == 'pushed to':
+                    yield event
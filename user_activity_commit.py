@@ -1,146 +1,69 @@
-import requests
-import os
+import sys
+import heapq
 import datetime
-import pandas as pd
-# Import relativedelta for accurate month calculation
-from dateutil.relativedelta import relativedelta 
-from dotenv import load_dotenv
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from _dates import MONTHS_TO_GO_BACK, AFTER_DATE, BEFORE_DATE, TOP_K
+from _reports import streaming_workbook, write_sheet
+from gitlab_client import GitlabClient, API_ERRORS, GITLAB_URL, PRIVATE_TOKEN, MAX_WORKERS
 
-# Load environment variables from .env file
-load_dotenv()
+CLIENT = GitlabClient()
 
-# --- Configuration ---
-GITLAB_URL = os.getenv("GITLAB_URL")
-PRIVATE_TOKEN = os.getenv("GITLAB_PRIVATE_TOKEN")
-
-# API Endpoints
-USERS_API_URL = f"{GITLAB_URL}/api/v4/users"
-EVENTS_PER_PAGE = 100 
-USERS_PER_PAGE = 100
-
-# Headers for authentication
-HEADERS = {
-    "Private-Token": PRIVATE_TOKEN
-}
+# One row of the 'Detailed Activity' sheet
+Event = namedtuple('Event', 'username activity project_id project_path commits branch date')
+DETAILED_COLUMNS = [
+    'Username', 'Activity Name', 'Project Name', 'Project Path',
+    'Commit Count', 'Pushed To Branch', 'Event Date'
+]
 
 # --- Date Calculation ---
-MONTHS_TO_GO_BACK = 6
 TODAY = datetime.date.today()
 
-# Use relativedelta for precise month subtraction
-end_date = TODAY + datetime.timedelta(days=1) # Events up to tomorrow
-start_date = TODAY - relativedelta(months=MONTHS_TO_GO_BACK) 
-
-# Convert to ISO 8601 format required by the API
-AFTER_DATE = start_date.strftime('%Y-%m-%d')
-BEFORE_DATE = end_date.strftime('%Y-%m-%d')
-
 print(f"Counting 'pushed to' events from {AFTER_DATE} to {BEFORE_DATE}...")
 
 # --- Helper Functions ---
 
-def get_all_users():
-    """Retrieves all active user IDs and usernames from GitLab, handling pagination."""
-    # ... (function body remains the same as your original script)
-    all_users = []
-    page = 1
-    
-    while True:
-        params = {
-            'per_page': USERS_PER_PAGE,
-            'page': page,
-            'active': True 
-        }
-        
-        try:
-            response = requests.get(USERS_API_URL, headers=HEADERS, params=params)
-            response.raise_for_status()
-            
-            users = response.json()
-            if not users:
-                break
-            
-            for user in users:
-                all_users.append({
-                    'id': user.get('id'),
-                    'username': user.get('username')
-                })
-            
-            page += 1
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching users: {e}")
-            return None
-    
-    print(f"Found {len(all_users)} active users.")
-    return all_users
-
 def get_user_push_events(user_id, username):
     """Retrieves detailed 'pushed to' events for a single user."""
     all_events = []
-    page = 1
     
-    while True:
-        # API endpoint for a specific user's events
-        USER_EVENTS_URL = f"{GITLAB_URL}/api/v4/users/{user_id}/events"
-        params = {
-            # Note: We still use 'action': 'pushed' for a preliminary filter
-            'action': 'pushed', 
-            'after': AFTER_DATE,
-            'before': BEFORE_DATE,
-            'per_page': EVENTS_PER_PAGE,
-            'page': page
-        }
-        
-        try:
-            response = requests.get(USER_EVENTS_URL, headers=HEADERS, params=params)
-            response.raise_for_status()
-            
-            events = response.json()
-            if not events:
-                break 
-
-            for event in events:
-                if event.get('action_name') == 'pushed to':
-                    # Extract the detailed push activity
-                    event_data = {
-                        'Username': username,
-                        # The 'push_data' is used for the detailed message
-                        'Activity Name': event.get('push_data', {}).get('action', event.get('action_name')),
-                        'Project Name': event.get('project_id'), # Keep ID for later lookup/joining if needed
-                        'Project Path': event.get('project_path'),
-                        'Commit Count': event.get('push_data', {}).get('commit_count'),
-                        'Pushed To Branch': event.get('push_data', {}).get('ref'),
-                        'Event Date': event.get('created_at')
-                    }
-                    all_events.append(event_data)
-            
-            page += 1
+    try:
+        for event in CLIENT.push_events(user_id, AFTER_DATE, BEFORE_DATE):
+            # The 'push_data' is used for the detailed message
+            push_data = event.get('push_data', {}) or {}
+            project_id = event.get('project_id')
             
-            if len(events) < EVENTS_PER_PAGE:
-                break
-
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching events for user {username} (ID: {user_id}): {e}")
-            break
+            # Extract the detailed push activity
+            all_events.append(Event(
+                username,
+                push_data.get('action', event.get('action_name')),
+                project_id, # Keep ID for later lookup/joining if needed
+                # Events only carry the project ID, so the path is looked up (once per project)
+                CLIENT.project_path(project_id) if project_id else None,
+                push_data.get('commit_count'),
+                push_data.get('ref'),
+                event.get('created_at')
+            ))
+
+    except API_ERRORS as e:
+        print(f"Error fetching events for user {username} (ID: {user_id}): {e}")
             
     return all_events
 
 def save_to_excel(summary_data, detailed_data):
     """Saves the push event summary and detailed data to a multi-sheet Excel file."""
     try:
-        # Create DataFrames
-        summary_df = pd.DataFrame(summary_data)
-        detailed_df = pd.DataFrame(detailed_data)
-
         # Sort summary by count
-        summary_df = summary_df.sort_values(by='Push Count', ascending=False)
+        summary_data = sorted(summary_data, key=lambda item: item['Push Count'], reverse=True)
         
         filename = f"GitLab_Push_Report_{TODAY.strftime('%Y%m%d')}.xlsx"
 
-        # Use ExcelWriter to write to multiple sheets
-        with pd.ExcelWriter(filename, engine='openpyxl') as writer:
-            summary_df.to_excel(writer, sheet_name='Summary', index=False)
-            detailed_df.to_excel(writer, sheet_name='Detailed Activity', index=False)
+        with streaming_workbook(filename) as workbook:
+            write_sheet(
+                workbook, 'Summary', ['Username', 'Push Count'],
+                [(item['Username'], item['Push Count']) for item in summary_data]
+            )
+            write_sheet(workbook, 'Detailed Activity', DETAILED_COLUMNS, detailed_data)
         
         print("\n" + "=" * 60)
         print(f"🎉 Successfully saved report to {filename}")
@@ -156,7 +79,7 @@ if __name__ == "__main__":
     if not GITLAB_URL or not PRIVATE_TOKEN:
         print("Error: GITLAB_URL or GITLAB_PRIVATE_TOKEN not found in environment variables.")
     else:
-        user_list = get_all_users()
+        user_list = CLIENT.user_list(active_after=AFTER_DATE)
         
         if user_list:
             # Store data for the final report
@@ -167,33 +90,46 @@ if __name__ == "__main__":
             print("-" * 50)
             print("Processing events for each user...")
             
-            for user in user_list:
-                user_id = user['id']
-                username = user['username']
-                
-                # Fetch detailed push events
-                events = get_user_push_events(user_id, username)
+            # Progress lines are written in one go once every user is processed
+            log_buf = []
+            
+            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                # Fetch detailed push events for several users at once
+                user_events = executor.map(
+                    lambda user: get_user_push_events(user['id'], user['username']),
+                    user_list
+                )
                 
-                count = len(events)
-                if count > 0:
-                    # Append detailed events to the list
-                    detailed_activity.extend(events)
+                for user, events in zip(user_list, user_events):
+                    username = user['username']
                     
-                    # Store summary data
-                    summary_results.append({
-                        'Username': username,
-                        'Push Count': count
-                    })
-                    total_pushes += count
-                    print(f"-> {username:<20}: {count} pushes")
+                    count = len(events)
+                    if count > 0:
+                        # Append detailed events to the list
+                        detailed_activity.extend(events)
+                        
+                        # Store summary data
+                        summary_results.append({
+                            'Username': username,
+                            'Push Count': count
+                        })
+                        total_pushes += count
+                        log_buf.append(f"-> {username:<20}: {count} pushes")
+
+            if log_buf:
+                sys.stdout.write("\n".join(log_buf) + "\n")
 
             # --- Output Results ---
             print("\n" + "=" * 50)
             print(f"✅ GitLab User Push Event Summary ({MONTHS_TO_GO_BACK} Months)")
             print("=" * 50)
             
-            # Print console summary
-            for item in sorted(summary_results, key=lambda x: x['Push Count'], reverse=True):
+            # Print console summary; the Excel report below still lists every user
+            if TOP_K:
+                top_results = heapq.nlargest(TOP_K, summary_results, key=lambda x: x['Push Count'])
+            else:
+                top_results = sorted(summary_results, key=lambda x: x['Push Count'], reverse=True)
+            for item in top_results:
                 print(f"{item['Username']:<25} {item['Push Count']}")
                     
             print("-" * 50)
@@ -1,209 +1,279 @@
-import requests
 import os
-import datetime
-from dotenv import load_dotenv
+import re
+import sys
+import time
+import hashlib
+import heapq
+import argparse
+import importlib.util
+import orjson
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from _dates import MONTHS_TO_GO_BACK, AFTER_DATE, BEFORE_DATE, TOP_K
+from _reports import NA, format_push_date, get_user_push_count
+from gitlab_client import GitlabClient, was_active_after, API_ERRORS, GITLAB_URL, PRIVATE_TOKEN, MAX_WORKERS
 import pandas as pd 
 
-# Load environment variables from .env file
-load_dotenv()
-
 # --- Configuration ---
-GITLAB_URL = os.getenv("GITLAB_URL")
-PRIVATE_TOKEN = os.getenv("GITLAB_PRIVATE_TOKEN")
-
 # NEW FILTER CRITERIA
 EMAIL_FILTER_SUBSTRING = "kestrl"
+# Compiled once, so matching doesn't lowercase both strings for every user
+_FILTER_RE = re.compile(re.escape(EMAIL_FILTER_SUBSTRING), re.IGNORECASE)
 
-# API Endpoints
-USERS_API_URL = f"{GITLAB_URL}/api/v4/users"
-EVENTS_PER_PAGE = 100 
-USERS_PER_PAGE = 100
+# The filtered user list rarely changes, so it is kept on disk for a day between runs
+USERS_CACHE_FILE = os.path.join('.cache', 'gitlab_users.json')
+USERS_CACHE_TTL = 24 * 60 * 60 # seconds
+# Emails are only returned to admin tokens, so lists fetched with different tokens
+# can differ; the cache records a hash of the token rather than the token itself
+TOKEN_FINGERPRINT = hashlib.sha256((PRIVATE_TOKEN or '').encode()).hexdigest()[:16]
 
-# Headers for authentication
-HEADERS = {
-    "Private-Token": PRIVATE_TOKEN
-}
+CLIENT = GitlabClient()
 
 # --- Date Calculation ---
-MONTHS_TO_GO_BACK = 6
-end_date = datetime.date.today() + datetime.timedelta(days=1) 
-start_date = end_date - datetime.timedelta(days=MONTHS_TO_GO_BACK * 30) 
-
-# Convert to ISO 8601 format required by the API
-AFTER_DATE = start_date.strftime('%Y-%m-%d')
-BEFORE_DATE = end_date.strftime('%Y-%m-%d')
-OUTPUT_FILENAME = f"gitlab_push_summary_kestrl_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}.xlsx"
+OUTPUT_FILENAME = f"gitlab_push_summary_kestrl_{AFTER_DATE.replace('-', '')}_{BEFORE_DATE.replace('-', '')}.xlsx"
 
 print(f"Counting 'pushed to' events for users containing '{EMAIL_FILTER_SUBSTRING}' in their email from {AFTER_DATE} to {BEFORE_DATE}...")
 
 # --- Helper Functions ---
 
-def get_all_users():
+def load_cached_users():
+    """
+    Returns the filtered user list saved by a previous run, or None if it is missing,
+    older than USERS_CACHE_TTL, or was saved for another instance, token, filter or window.
+    """
+    try:
+        if time.time() - os.path.getmtime(USERS_CACHE_FILE) >= USERS_CACHE_TTL:
+            return None
+        with open(USERS_CACHE_FILE, 'rb') as f:
+            cache = orjson.loads(f.read())
+    except (OSError, orjson.JSONDecodeError):
+        return None
+    
+    if (cache.get('gitlab_url') != GITLAB_URL
+            or cache.get('token') != TOKEN_FINGERPRINT
+            or cache.get('email_filter') != EMAIL_FILTER_SUBSTRING
+            or cache.get('after_date') != AFTER_DATE):
+        return None
+    return cache.get('users')
+
+def save_cached_users(users):
+    """Saves the filtered user list for later runs; a failed write only costs the next run a refetch."""
+    try:
+        os.makedirs(os.path.dirname(USERS_CACHE_FILE), exist_ok=True)
+        with open(USERS_CACHE_FILE, 'wb') as f:
+            f.write(orjson.dumps({
+                'gitlab_url': GITLAB_URL,
+                'token': TOKEN_FINGERPRINT,
+                'email_filter': EMAIL_FILTER_SUBSTRING,
+                'after_date': AFTER_DATE,
+                'users': users
+            }))
+    except OSError as e:
+        print(f"Warning: could not write user cache {USERS_CACHE_FILE}: {e}")
+
+def get_all_users(refresh=False):
     """
     Retrieves all active user IDs and usernames from GitLab, handling pagination,
     and filters them based on the EMAIL_FILTER_SUBSTRING.
+    
+    A list cached within the last day is reused unless `refresh` is set. The cache
+    holds every matching user, since one idle when it was written may push before
+    it expires; only a fresh fetch drops users idle since before AFTER_DATE.
     """
+    if not refresh:
+        cached_users = load_cached_users()
+        if cached_users is not None:
+            print(f"Found {len(cached_users)} users matching the email filter (cached in {USERS_CACHE_FILE}).")
+            return cached_users
+    
+    matching_users = []
     all_users = []
-    page = 1
     
-    while True:
-        params = {
-            'per_page': USERS_PER_PAGE,
-            'page': page,
-            'active': True # Only process active users
-        }
-        
-        try:
-            response = requests.get(USERS_API_URL, headers=HEADERS, params=params)
-            response.raise_for_status()
-            
-            users = response.json()
-            if not users:
-                break # No more users
-            
-            for user in users:
-                # --- NEW FILTER LOGIC ---
-                user_email = user.get('email', '')
-                if EMAIL_FILTER_SUBSTRING.lower() in user_email.lower():
-                    all_users.append({
-                        'id': user.get('id'),
-                        'username': user.get('username'),
-                        'email': user_email # Include email for clarity in final output
-                    })
-                # -------------------------
-            
-            page += 1
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching users: {e}")
-            return None
+    try:
+        for user in CLIENT.users():
+            # --- NEW FILTER LOGIC ---
+            # This has to stay client-side: `/users?search=` only matches emails
+            # exactly, so a substring like EMAIL_FILTER_SUBSTRING would miss them
+            user_email = user.get('email') or '' # Not returned to non-admin tokens
+            if _FILTER_RE.search(user_email):
+                user_row = {
+                    'id': user.get('id'),
+                    'username': user.get('username'),
+                    'email': user_email # Include email for clarity in final output
+                }
+                matching_users.append(user_row)
+                if was_active_after(user, AFTER_DATE):
+                    all_users.append(user_row)
+            # -------------------------
+    except API_ERRORS as e:
+        print(f"Error fetching users: {e}")
+        return None
     
+    # An empty list usually means the token can't see emails, so it isn't worth keeping
+    if matching_users:
+        save_cached_users(matching_users)
     print(f"Found {len(all_users)} active users matching the email filter.")
     return all_users
 
-# --- (get_user_push_count remains the same) ---
+def iter_user_push_details(user_list):
+    """
+    Fetches each user's push events concurrently and yields
+    (user, (push_count, last_push_date, last_push_commit_sha)) in `user_list` order.
+    """
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        # Fetch count and last push details for several users at once
+        push_details = executor.map(
+            lambda user: get_user_push_count(CLIENT, user['id'], user['username']),
+            user_list
+        )
+        
+        yield from zip(user_list, push_details)
 
-def get_user_push_count(user_id, username):
+def get_all_push_details(user_list):
     """
-    Counts 'pushed to' events for a single user and records the details 
-    of the most recent push.
+    Counts 'pushed to' events for every user in one pass over the instance-wide
+    `/events?scope=all` feed, instead of one paginated request chain per user.
     
-    Returns: (push_count, last_push_date, last_push_commit_sha)
+    Returns: {user_id: (push_count, last_push_date, last_push_commit_sha)},
+    or None if the events couldn't be fetched.
     """
-    push_count = 0
-    page = 1
+    user_ids = {user['id'] for user in user_list}
+    push_counts = Counter()
+    last_pushes = {} # author_id -> (created_at, commit SHA) of their latest push
     
-    last_push_datetime = datetime.datetime(1, 1, 1, tzinfo=datetime.timezone.utc)
-    last_push_commit_sha = "N/A"
-    
-    while True:
-        USER_EVENTS_URL = f"{GITLAB_URL}/api/v4/users/{user_id}/events"
-        params = {
-            'action': 'pushed', 
-            'after': AFTER_DATE,
-            'before': BEFORE_DATE,
-            'per_page': EVENTS_PER_PAGE,
-            'page': page
-        }
-        
-        try:
-            response = requests.get(USER_EVENTS_URL, headers=HEADERS, params=params)
-            response.raise_for_status()
-            
-            events = response.json()
-            if not events:
-                break 
-            
-            for event in events:
-                if event.get('action_name') == 'pushed to':
-                    push_count += 1
-                    
-                    current_event_datetime = datetime.datetime.fromisoformat(
-                        event['created_at'].replace('Z', '+00:00')
-                    )
-                    
-                    if current_event_datetime > last_push_datetime:
-                        last_push_datetime = current_event_datetime
-                        push_data = event.get('push_data', {})
-                        last_push_commit_sha = push_data.get('commit_to', 'N/A')
-                        
-            
-            page += 1
-            
-            if len(events) < EVENTS_PER_PAGE:
-                break
-
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching events for user {username} (ID: {user_id}): {e}")
-            break
+    try:
+        for event in CLIENT.all_push_events(AFTER_DATE, BEFORE_DATE):
+            author_id = event.get('author_id')
+            if author_id not in user_ids:
+                continue
+            push_counts[author_id] += 1
             
-    formatted_date = last_push_datetime.strftime('%Y-%m-%d %H:%M:%S') if push_count > 0 else "N/A"
+            created_at = event['created_at']
+            if created_at > last_pushes.get(author_id, ('',))[0]:
+                push_data = event.get('push_data') or {} # null for some events
+                last_pushes[author_id] = (created_at, push_data.get('commit_to') or NA)
+    except API_ERRORS as e:
+        print(f"Error fetching instance-wide events: {e}")
+        return None
     
-    return (push_count, formatted_date, last_push_commit_sha)
+    return {
+        author_id: (count, format_push_date(last_pushes[author_id][0]), last_pushes[author_id][1])
+        for author_id, count in push_counts.items()
+    }
 
 # --- (save_to_xlsx updated to handle email) ---
 
-def save_to_xlsx(results_data, filename):
-    """Converts the results dictionary to a Pandas DataFrame and saves it to an XLSX file."""
+def save_to_xlsx(results_columns, filename):
+    """Builds a Pandas DataFrame from the result columns and saves it to an XLSX file."""
     try:
-        # Convert dictionary of dictionaries into a DataFrame
-        df = pd.DataFrame.from_dict(results_data, orient='index')
-        
-        # Reset index to make 'Username' a column
-        df = df.reset_index().rename(columns={'index': 'Username'})
-        
-        # Rename columns for clarity
-        df.columns = ['Username', 'Email', 'Push Count', 'Last Push Date/Time', 'Last Commit SHA']
+        # The columns are already named for the report, so no reshaping is needed
+        df = pd.DataFrame(results_columns)
         
         # Sort the DataFrame by 'Push Count' descending
         df = df.sort_values(by='Push Count', ascending=False)
         
-        # Write to Excel file
-        df.to_excel(filename, index=False, sheet_name='GitLab Push Summary')
+        # Write to Excel file with xlsxwriter, which is faster than the openpyxl default.
+        # constant_memory isn't enabled: pandas writes cells column by column, and in
+        # that mode xlsxwriter drops anything written above the row it is on.
+        with pd.ExcelWriter(filename, engine='xlsxwriter') as writer:
+            df.to_excel(writer, index=False, sheet_name='GitLab Push Summary')
         print(f"\n✨ Successfully saved results to: **{filename}**")
     except Exception as e:
         print(f"\n❌ Error saving to XLSX file: {e}")
 
+def save_to_parquet(results_columns, filename):
+    """Builds a Pandas DataFrame from the result columns and saves it to a Parquet file (needs pyarrow)."""
+    try:
+        df = pd.DataFrame(results_columns).sort_values(by='Push Count', ascending=False)
+        df.to_parquet(filename, engine='pyarrow', compression='snappy', index=False)
+        print(f"\n✨ Successfully saved results to: **{filename}**")
+    except Exception as e:
+        print(f"\n❌ Error saving to Parquet file: {e}")
+
 # --- Main Logic ---
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=f"Summarize push activity of GitLab users whose email contains '{EMAIL_FILTER_SUBSTRING}'.")
+    parser.add_argument('--refresh', action='store_true', help="refetch the user list instead of using the one cached within the last day")
+    parser.add_argument(
+        '--all-events', action='store_true',
+        help="count pushes from one pass over /events?scope=all instead of per-user requests; "
+             "only counts pushes to projects the token's user is a member of (admin rights don't widen it), "
+             "and falls back to per-user requests if it fails"
+    )
+    parser.add_argument(
+        '--parquet', action='store_true',
+        help="also save the report as Parquet (needs pyarrow), for loading into other tools"
+    )
+    args = parser.parse_args()
+
     # Check for pandas requirement
     try:
         pd.DataFrame()
     except NameError:
         print("\n**CRITICAL ERROR:** The 'pandas' library is required to save to XLSX.")
-        print("Please install it: `pip install pandas openpyxl`")
+        print("Please install it: `pip install pandas xlsxwriter`")
+        exit()
+
+    # Checked before any API calls, so a missing pyarrow doesn't cost a full run
+    if args.parquet and importlib.util.find_spec('pyarrow') is None:
+        print("\n**CRITICAL ERROR:** The 'pyarrow' library is required for --parquet.")
+        print("Please install it: `pip install pyarrow`")
         exit()
 
     if not GITLAB_URL or not PRIVATE_TOKEN:
         print("Error: GITLAB_URL or GITLAB_PRIVATE_TOKEN not found in .env file.")
     else:
-        user_list = get_all_users()
+        user_list = get_all_users(refresh=args.refresh)
         
         if user_list:
-            results_details = {} 
+            # One list per report column, appended to in step, so the DataFrame
+            # is built straight from them
+            results_columns = {
+                'Username': [],
+                'Email': [],
+                'Push Count': [],
+                'Last Push Date/Time': [],
+                'Last Commit SHA': []
+            }
             total_pushes = 0
             
             print("-" * 75)
             print("Processing events and finding latest push activity for each user...")
             
-            for user in user_list:
-                user_id = user['id']
+            # Progress lines are written in one go once every user is processed
+            log_buf = []
+            
+            all_push_details = get_all_push_details(user_list) if args.all_events else None
+            if all_push_details is not None:
+                print("Warning: --all-events only counts pushes to projects the token's user is a member of.")
+                # Users missing from the feed didn't push to those projects in the window
+                push_details = (
+                    (user, all_push_details.get(user['id'], (0, NA, NA)))
+                    for user in user_list
+                )
+            else:
+                if args.all_events:
+                    print("Falling back to fetching events for each user...")
+                push_details = iter_user_push_details(user_list)
+            
+            # Results are only collected here, in the main thread, so the lists need no lock
+            for user, (count, last_date, last_commit) in push_details:
                 username = user['username']
                 user_email = user['email'] # Retrieve email here
                 
-                # Fetch count and last push details
-                count, last_date, last_commit = get_user_push_count(user_id, username)
-                
                 # Store only users who have push events
                 if count > 0:
-                    results_details[username] = {
-                        'email': user_email, # Added email to results
-                        'count': count,
-                        'last_date': last_date,
-                        'last_commit': last_commit
-                    }
+                    results_columns['Username'].append(username)
+                    results_columns['Email'].append(user_email) # Added email to results
+                    results_columns['Push Count'].append(count)
+                    results_columns['Last Push Date/Time'].append(last_date)
+                    results_columns['Last Commit SHA'].append(last_commit)
                     total_pushes += count
-                    print(f"-> {username:<20} ({user_email}): {count} pushes, Last: {last_date} ({last_commit[:8]}...)")
+                    log_buf.append(f"-> {username:<20} ({user_email}): {count} pushes, Last: {last_date} ({last_commit[:8]}...)")
+
+            if log_buf:
+                sys.stdout.write("\n".join(log_buf) + "\n")
 
             # --- Output Results to Console and XLSX ---
             
@@ -211,25 +281,27 @@ if __name__ == "__main__":
             print(f"✅ GitLab Push Event Summary for Users with '{EMAIL_FILTER_SUBSTRING}' ({MONTHS_TO_GO_BACK} Months)")
             print("=" * 110)
             
-            # Sort the results for console output
-            sorted_results = sorted(
-                results_details.items(), 
-                key=lambda item: item[1]['count'], 
-                reverse=True
-            )
+            # Sort the results for console output; the XLSX below still lists every user
+            rows = zip(*results_columns.values())
+            if TOP_K:
+                sorted_results = heapq.nlargest(TOP_K, rows, key=lambda row: row[2])
+            else:
+                sorted_results = sorted(rows, key=lambda row: row[2], reverse=True)
             
             # Print Header
             print(f"{'Username':<20} {'Email':<30} {'Pushes':<8} {'Last Push Date':<20} {'Last Commit SHA (First 8)':<20}")
             print("-" * 110)
 
-            for username, data in sorted_results:
-                print(f"{username:<20} {data['email']:<30} {data['count']:<8} {data['last_date']:<20} {data['last_commit'][:8]:<20}")
+            for username, user_email, count, last_date, last_commit in sorted_results:
+                print(f"{username:<20} {user_email:<30} {count:<8} {last_date:<20} {last_commit[:8]:<20}")
                 
             print("-" * 110)
-            print(f"Total Unique Contributors (kestrl): {len(results_details)}")
+            print(f"Total Unique Contributors (kestrl): {len(results_columns['Username'])}")
             print(f"Total Push Events (kestrl): {total_pushes}")
             print("=" * 110)
             
-            # XLSX Output
-            if results_details:
-                save_to_xlsx(results_details, OUTPUT_FILENAME)
\ No newline at end of file
+            # XLSX Output, plus Parquet if asked for
+            if results_columns['Username']:
+                save_to_xlsx(results_columns, OUTPUT_FILENAME)
+                if args.parquet:
+                    save_to_parquet(results_columns, OUTPUT_FILENAME.replace('.xlsx', '.parquet'))
\ No newline at end of file